@@ -0,0 +1 @@
+# FastAPI app for macOS Tahoe chatbot
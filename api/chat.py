@@ -1,24 +1,31 @@
+import asyncio
+import hashlib
+import json
 import os
-import sys
+from dataclasses import dataclass, field
 from pathlib import Path
-
-# Add parent directory to path for imports
-sys.path.insert(0, str(Path(__file__).parent.parent))
+from urllib.parse import parse_qs, urlparse
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import anthropic
-from ddgs import DDGS
+import httpx
+import numpy as np
+from selectolax.lexbor import LexborHTMLParser
 
-from rag.retriever import get_retriever
+from api.batcher import AsyncBatcher
+from rag.cache import SemanticCache, TTLCache
+from rag.retriever import RELEVANCE_THRESHOLD, get_retriever
 
-# Load environment variables
+# Load environment variables from .env for local runs; variables already set
+# (e.g. by the deployment or the shell) take precedence
 env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(env_path)
+if env_path.exists():
+    load_dotenv(env_path, override=False)
 
 app = FastAPI()
 
@@ -31,30 +38,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize retriever on startup
+# Initialize retriever, Anthropic client and web search session on startup
 retriever = None
+client = None
+web_client = None
+
+# Responses for near-duplicate queries (same history) are served from here
+semantic_cache = SemanticCache()
+
+# Exact-match web search results, plus fetches in progress so concurrent
+# identical queries share one upstream request
+web_cache = TTLCache(ttl=600, maxsize=1024)
+web_inflight: dict[tuple[str, int], asyncio.Task] = {}
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the RAG retriever on startup."""
-    global retriever
+    """Initialize the Anthropic client, web search client and RAG retriever on startup."""
+    global retriever, client, web_client
+    # One client per process so the HTTPS connection pool is reused across requests
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if api_key:
+        client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=2)
+    else:
+        print("Warning: ANTHROPIC_API_KEY not set")
+
+    # Keep-alive HTTP/2 pool for web search; short timeout, failures are soft
+    web_client = httpx.AsyncClient(
+        http2=True,
+        timeout=WEB_SEARCH_TIMEOUT,
+        headers=WEB_SEARCH_HEADERS,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
+
     try:
         retriever = get_retriever()
-        retriever.initialize()
+        retriever.warmup()
         print("RAG retriever initialized successfully")
     except Exception as e:
         print(f"Warning: Could not initialize RAG retriever: {e}")
         print("Chat will work without RAG context")
 
 
-SYSTEM_PROMPT_RAG = """You are a helpful assistant for macOS Tahoe (macOS 26). You have access to official Apple documentation and a web search fallback for topics outside your documentation.
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let in-flight Claude batches finish and close HTTP pools before exiting."""
+    await claude_batcher.stop()
+    if web_client is not None:
+        await web_client.aclose()
 
-Reference Documentation:
-{context}
+
+SYSTEM_PROMPT_RAG = """You are a helpful assistant for macOS Tahoe (macOS 26). You have access to official Apple documentation and a web search fallback for topics outside your documentation.
 
 HOW TO ANSWER:
-1. Use the documentation above when it has relevant info.
+1. Use the reference documentation below when it has relevant info.
 2. For topics partially covered in docs, supplement with your general knowledge but be transparent: "Based on general macOS knowledge..." or "Typically in previous releases..."
 3. If the user asks about something not related to macOS Tahoe (e.g., Windows, Android, Linux, general tech), let them know that your documentation is focused on macOS Tahoe, but they can ask again and our system will search the web for relevant information.
 4. Be helpful first. Acknowledge limits briefly, then still provide value.
@@ -79,9 +116,6 @@ SYSTEM_PROMPT_WEB = """You are a helpful general-purpose tech assistant. You als
 
 This question was outside your local macOS documentation, so a web search was performed. You MUST use the web search results below to provide a thorough, helpful answer.
 
-Web Search Results:
-{context}
-
 HOW TO ANSWER:
 1. ALWAYS answer the user's question using the web search results. Never refuse to answer.
 2. Summarize the key points clearly and directly from the search results.
@@ -103,12 +137,6 @@ FORMATTING:
 
 SYSTEM_PROMPT_HYBRID = """You are a helpful assistant for macOS Tahoe (macOS 26). You have access to official Apple documentation AND supplementary web search results.
 
-Official Documentation:
-{rag_context}
-
-Web Search Results:
-{web_context}
-
 HOW TO ANSWER:
 1. Use the official documentation for macOS Tahoe information — this is your primary source.
 2. Use the web search results for information outside your documentation (e.g., Windows, Android, other tech).
@@ -130,6 +158,49 @@ FORMATTING:
 - No emojis."""
 
 
+# Per-request context, sent after the constant instructions above
+CONTEXT_RAG = """Reference Documentation:
+{context}"""
+
+CONTEXT_WEB = """Web Search Results:
+{context}"""
+
+CONTEXT_HYBRID = """Official Documentation:
+{rag_context}
+
+Web Search Results:
+{web_context}"""
+
+# Templates are split once so building a prompt is plain concatenation
+_PREFIX_RAG, _SUFFIX_RAG = CONTEXT_RAG.split("{context}")
+_PREFIX_WEB, _SUFFIX_WEB = CONTEXT_WEB.split("{context}")
+_PREFIX_HYBRID, _HYBRID_TAIL = CONTEXT_HYBRID.split("{rag_context}")
+_MID_HYBRID, _SUFFIX_HYBRID = _HYBRID_TAIL.split("{web_context}")
+
+# Instruction blocks are built once and marked for Anthropic prompt caching
+CACHED_INSTRUCTIONS = {
+    name: {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}
+    for name, prompt in (
+        ("rag", SYSTEM_PROMPT_RAG),
+        ("web", SYSTEM_PROMPT_WEB),
+        ("both", SYSTEM_PROMPT_HYBRID),
+    )
+}
+
+
+def build_system(source_type: str, context: str) -> list[dict]:
+    """Build system blocks: cached instructions followed by the request's context."""
+    return [CACHED_INSTRUCTIONS[source_type], {"type": "text", "text": context}]
+
+
+# DuckDuckGo's no-JS results page, fetched over a shared keep-alive client
+WEB_SEARCH_URL = "https://html.duckduckgo.com/html/"
+WEB_SEARCH_TIMEOUT = 3.0
+WEB_SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+}
+
+
 class ChatRequest(BaseModel):
     message: str
     history: list = []
@@ -142,16 +213,150 @@ class ChatResponse(BaseModel):
     source_type: str = "rag"  # "rag", "web", or "both"
 
 
-def web_search(query: str, max_results: int = 5) -> list[dict]:
-    """Search the web using DuckDuckGo (ddgs) and return results."""
+def _unwrap_ddg_url(href: str) -> str:
+    """Turn a DuckDuckGo redirect link (//duckduckgo.com/l/?uddg=...) into the target URL."""
+    if href.startswith("//"):
+        href = "https:" + href
+    target = parse_qs(urlparse(href).query).get("uddg")
+    return target[0] if target else href
+
+
+def parse_ddg_results(html: str, max_results: int) -> list[dict]:
+    """Extract results from DuckDuckGo's HTML endpoint, skipping ads."""
+    results = []
+    for node in LexborHTMLParser(html).css("div.result"):
+        if "result--ad" in (node.attributes.get("class") or ""):
+            continue
+        link = node.css_first("a.result__a")
+        if link is None:
+            continue
+        snippet = node.css_first(".result__snippet")
+        results.append({
+            "title": link.text(strip=True),
+            "url": _unwrap_ddg_url(link.attributes.get("href") or ""),
+            "snippet": snippet.text(strip=True) if snippet else "",
+        })
+        if len(results) >= max_results:
+            break
+    return results
+
+
+async def _fetch_web_results(query: str, max_results: int) -> list[dict]:
+    """Fetch and cache DuckDuckGo results; failures return no results."""
+    if web_client is None:
+        return []
+
     try:
-        results = DDGS().text(query, max_results=max_results)
-        print("results from ddgs : ", results)
-        return [{"title": r["title"], "url": r["href"], "snippet": r["body"]} for r in results]
+        response = await web_client.post(WEB_SEARCH_URL, data={"q": query})
+        response.raise_for_status()
+        results = parse_ddg_results(response.text, max_results)
+        print(f"[DEBUG] Web search: {len(results)} results from DuckDuckGo")
     except Exception as e:
         print(f"[DEBUG] Web search error: {type(e).__name__}: {e}")
         return []
 
+    # Empty pages are usually DuckDuckGo rate limiting, so don't cache them
+    if results:
+        web_cache.set((query, max_results), results)
+    return results
+
+
+async def web_search(query: str, max_results: int = 5) -> list[dict]:
+    """
+    Search the web using DuckDuckGo's HTML endpoint and return results.
+
+    Repeats within the cache TTL are served from web_cache, and concurrent
+    identical queries share a single upstream request.
+    """
+    key = (query, max_results)
+    cached = web_cache.get(key)
+    if cached is not None:
+        return cached
+
+    task = web_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_web_results(query, max_results))
+        web_inflight[key] = task
+        task.add_done_callback(lambda _: web_inflight.pop(key, None))
+
+    # Shielded so one caller disconnecting doesn't cancel the shared fetch
+    return await asyncio.shield(task)
+
+
+# Concurrent chat requests are coalesced and sent through one client
+MAX_CONCURRENT_CLAUDE_CALLS = 8
+claude_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CLAUDE_CALLS)
+
+
+async def create_message(payload: dict):
+    """Call Claude, bounded by the shared concurrency limit."""
+    async with claude_semaphore:
+        return await client.messages.create(**payload)
+
+
+async def process_claude_batch(payloads: list[dict]) -> list:
+    """Issue a batch of Claude calls together; failures are returned per item."""
+    return await asyncio.gather(*(create_message(p) for p in payloads), return_exceptions=True)
+
+
+claude_batcher = AsyncBatcher(process_claude_batch, max_batch_size=8, batch_wait_timeout_s=0.05)
+
+
+# Web search is skipped when the best RAG chunk beats the relevance
+# threshold by at least this margin (set ALWAYS_WEB_SEARCH=true to disable)
+ALWAYS_WEB_SEARCH = os.environ.get("ALWAYS_WEB_SEARCH", "false").lower() == "true"
+CONFIDENT_MARGIN = 0.15
+
+
+def needs_web_search(chunks: list[dict], rag_relevant: bool) -> bool:
+    """Decide whether RAG results are weak enough to supplement with a web search."""
+    if ALWAYS_WEB_SEARCH or not rag_relevant or not chunks:
+        return True
+    return chunks[0]["score"] > RELEVANCE_THRESHOLD - CONFIDENT_MARGIN
+
+
+def rag_search(query: str, k: int = 5) -> tuple[list[dict], bool]:
+    """Retrieve chunks from the RAG index, returning ([], False) if unavailable."""
+    if not (retriever and retriever._initialized):
+        return [], False
+
+    try:
+        # Repeated queries are answered from the retriever's result cache
+        return retriever.retrieve(query, k=k)
+    except Exception as e:
+        print(f"[DEBUG] RAG retrieval error: {e}")
+        return [], False
+
+
+# Conversation turns sent to Claude (last 10 exchanges)
+MAX_HISTORY_MESSAGES = 20
+
+
+def normalize_history(history: list) -> list[dict]:
+    """
+    Clean up conversation history before it is sent to Claude.
+
+    Strips whitespace, drops empty turns, merges consecutive turns from the
+    same role (dropping exact repeats, e.g. from client retries), keeps the
+    last MAX_HISTORY_MESSAGES turns and makes sure it starts with a user turn.
+    """
+    turns = []
+    for msg in history:
+        role = msg.get("role")
+        content = str(msg.get("content", "")).strip()
+        if role not in ("user", "assistant") or not content:
+            continue
+        if turns and turns[-1]["role"] == role:
+            if content != turns[-1]["content"]:
+                turns[-1]["content"] += "\n\n" + content
+            continue
+        turns.append({"role": role, "content": content})
+
+    turns = turns[-MAX_HISTORY_MESSAGES:]
+    while turns and turns[0]["role"] != "user":
+        turns.pop(0)
+    return turns
+
 
 def format_web_context(results: list[dict]) -> str:
     """Format web search results as context for the LLM."""
@@ -163,50 +368,89 @@ def format_web_context(results: list[dict]) -> str:
     return "\n\n---\n\n".join(parts)
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
+@dataclass
+class PreparedChat:
+    """A chat request after retrieval: either a cached answer or a Claude payload."""
+    payload: dict = field(default_factory=dict)
+    sources: list = field(default_factory=list)
+    web_sources: list = field(default_factory=list)
+    source_type: str = "rag"
+    query_vector: np.ndarray | None = None
+    cache_scope: str = ""
+    cached: ChatResponse | None = None
 
-    if not api_key:
-        raise HTTPException(status_code=500, detail="API key not configured")
+    def to_response(self, text: str) -> ChatResponse:
+        return ChatResponse(
+            response=text,
+            sources=self.sources,
+            web_sources=self.web_sources,
+            source_type=self.source_type
+        )
 
-    client = anthropic.Anthropic(api_key=api_key)
+    def remember(self, chat_response: ChatResponse):
+        """Store a finished answer in the semantic cache."""
+        if self.query_vector is not None:
+            semantic_cache.put(self.query_vector, chat_response, scope=self.cache_scope)
 
+
+async def prepare_chat(request: ChatRequest) -> PreparedChat:
+    """Check the semantic cache, then run retrieval and build the Claude payload."""
     # Retrieve relevant context using RAG
     rag_context = ""
     web_context = ""
     sources = []
     web_sources = []
     source_type = "rag"
-    rag_relevant = False
 
     print(f"\n{'='*60}")
     print(f"[DEBUG] Query: \"{request.message}\"")
 
-    # Step 1: Try RAG
+    # Step 0: Serve near-duplicate queries from the semantic cache
+    query_vector = None
+    history = normalize_history(request.history)
+    cache_scope = hashlib.sha256(json.dumps(history).encode()).hexdigest()
     if retriever and retriever._initialized:
         try:
-            chunks, rag_relevant = retriever.retrieve(request.message, k=5)
-            if chunks:
-                best = chunks[0]
-                print(f"[DEBUG] RAG relevant: {rag_relevant}")
-                print(f"[DEBUG] Best score: {best['score']:.4f} (semantic: {best['semantic_score']:.4f}, keyword_boost: {best['keyword_boost']:.2f})")
-                print(f"[DEBUG] Threshold: 0.35 | {'PASS - score < threshold' if rag_relevant else 'FAIL - score >= threshold'}")
-                print(f"[DEBUG] Best match source: {best['source']}")
-                print(f"[DEBUG] All chunk scores: {[round(c['score'], 4) for c in chunks]}")
-            else:
-                print(f"[DEBUG] No chunks returned from RAG")
-
-            if rag_relevant:
-                rag_context = retriever.format_context(chunks)
-                sources = list(set(chunk["source"] for chunk in chunks))
-                print(f"[DEBUG] RAG sources: {sources}")
+            query_vector = await asyncio.to_thread(retriever.embed_query, request.message)
+            cached = semantic_cache.get(query_vector, scope=cache_scope)
+            if cached is not None:
+                print("[DEBUG] Semantic cache hit")
+                print(f"{'='*60}\n")
+                return PreparedChat(cached=cached)
         except Exception as e:
-            print(f"[DEBUG] RAG retrieval error: {e}")
+            print(f"[DEBUG] Semantic cache error: {e}")
+
+    # Step 1: RAG retrieval, then web search only when RAG isn't confident.
+    # Retrieval runs off the event loop; both run concurrently if web search is forced.
+    if ALWAYS_WEB_SEARCH:
+        (chunks, rag_relevant), search_results = await asyncio.gather(
+            asyncio.to_thread(rag_search, request.message, 5),
+            web_search(request.message),
+        )
+    else:
+        chunks, rag_relevant = await asyncio.to_thread(rag_search, request.message, 5)
+        search_results = []
+        if needs_web_search(chunks, rag_relevant):
+            search_results = await web_search(request.message)
+        else:
+            print("[DEBUG] RAG confident, skipping web search")
+
+    if chunks:
+        best = chunks[0]
+        print(f"[DEBUG] RAG relevant: {rag_relevant}")
+        print(f"[DEBUG] Best score: {best['score']:.4f} (semantic: {best['semantic_score']:.4f}, keyword_boost: {best['keyword_boost']:.2f})")
+        print(f"[DEBUG] Threshold: 0.35 | {'PASS - score < threshold' if rag_relevant else 'FAIL - score >= threshold'}")
+        print(f"[DEBUG] Best match source: {best['source']}")
+        print(f"[DEBUG] All chunk scores: {[round(c['score'], 4) for c in chunks]}")
+    else:
+        print(f"[DEBUG] No chunks returned from RAG")
+
+    if rag_relevant:
+        rag_context = retriever.format_context(chunks)
+        sources = list(dict.fromkeys(chunk["source"] for chunk in chunks))
+        print(f"[DEBUG] RAG sources: {sources}")
 
-    # Step 2: Always do web search to supplement
-    print(f"[DEBUG] Running web search to supplement...")
-    search_results = web_search(request.message)
+    # Step 2: Web search results (if any) supplement RAG
     if search_results:
         web_context = format_web_context(search_results)
         web_sources = [{"title": r["title"], "url": r["url"]} for r in search_results]
@@ -221,42 +465,99 @@ async def chat(request: ChatRequest):
     # Step 3: Decide source_type and build prompt
     if rag_relevant and web_sources:
         source_type = "both"
-        system_prompt = SYSTEM_PROMPT_HYBRID.format(rag_context=rag_context, web_context=web_context)
+        system_prompt = build_system(source_type, _PREFIX_HYBRID + rag_context + _MID_HYBRID + web_context + _SUFFIX_HYBRID)
     elif rag_relevant:
         source_type = "rag"
-        system_prompt = SYSTEM_PROMPT_RAG.format(context=rag_context)
+        system_prompt = build_system(source_type, _PREFIX_RAG + rag_context + _SUFFIX_RAG)
     elif web_sources:
         source_type = "web"
-        system_prompt = SYSTEM_PROMPT_WEB.format(context=web_context)
+        system_prompt = build_system(source_type, _PREFIX_WEB + web_context + _SUFFIX_WEB)
     else:
         source_type = "rag"
-        system_prompt = SYSTEM_PROMPT_RAG.format(context="No documentation or web results found.")
+        system_prompt = build_system(source_type, _PREFIX_RAG + "No documentation or web results found." + _SUFFIX_RAG)
 
     print(f"[DEBUG] DECISION: source_type={source_type}")
     print(f"{'='*60}\n")
 
-    # Build messages with history
-    messages = []
-    for msg in request.history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": request.message})
+    # Build messages with history; a trailing user turn (e.g. after a failed
+    # request) is merged so roles keep alternating
+    messages = [dict(turn) for turn in history]
+    if messages and messages[-1]["role"] == "user":
+        messages[-1]["content"] += "\n\n" + request.message
+    else:
+        messages.append({"role": "user", "content": request.message})
+
+    return PreparedChat(
+        payload={
+            "model": "claude-sonnet-4-20250514",
+            "max_tokens": 1024,
+            "system": system_prompt,
+            "messages": messages,
+        },
+        sources=sources,
+        web_sources=web_sources,
+        source_type=source_type,
+        query_vector=query_vector,
+        cache_scope=cache_scope,
+    )
+
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    if client is None:
+        raise HTTPException(status_code=500, detail="API key not configured")
+
+    prepared = await prepare_chat(request)
+    if prepared.cached is not None:
+        return prepared.cached
 
     try:
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            system=system_prompt,
-            messages=messages
-        )
-        return ChatResponse(
-            response=response.content[0].text,
-            sources=sources,
-            web_sources=web_sources,
-            source_type=source_type
-        )
+        response = await claude_batcher.submit(prepared.payload)
+        chat_response = prepared.to_response(response.content[0].text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    prepared.remember(chat_response)
+    return chat_response
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the answer as server-sent events: text deltas, then a sources event."""
+    if client is None:
+        raise HTTPException(status_code=500, detail="API key not configured")
+
+    prepared = await prepare_chat(request)
+
+    async def event_generator():
+        if prepared.cached is not None:
+            chat_response = prepared.cached
+            yield sse_event({"delta": chat_response.response})
+        else:
+            parts = []
+            try:
+                async with claude_semaphore:
+                    async with client.messages.stream(**prepared.payload) as stream:
+                        async for text in stream.text_stream:
+                            parts.append(text)
+                            yield sse_event({"delta": text})
+            except Exception as e:
+                yield sse_event({"detail": str(e)}, event="error")
+                return
+
+            chat_response = prepared.to_response("".join(parts))
+            prepared.remember(chat_response)
+
+        yield sse_event(chat_response.model_dump(exclude={"response"}), event="sources")
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
 
 # Health check endpoint
 @app.get("/api/health")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Caches for macOS Tahoe RAG chatbot.
+Semantic cache returns a stored value when a new query embedding is
+near-identical (cosine similarity) to a previously cached one.
+TTL and LRU caches memoize exact-match lookups (for a fixed time, or
+until evicted).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+
+import faiss
+import numpy as np
+
+# Semantic cache parameters
+SIMILARITY_THRESHOLD = 0.95  # Cosine similarity needed for a cache hit
+MAX_ENTRIES = 10_000  # Least recently used entries are evicted past this
+SEARCH_K = 4  # Near neighbours checked for a matching scope
+
+
+class SemanticCache:
+    """LRU cache keyed by L2-normalized query embeddings (inner product = cosine)."""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._index = None  # Created on first put, once the embedding size is known
+        self._entries: OrderedDict[int, tuple[str, object]] = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _as_query(vector) -> np.ndarray:
+        """Copy a vector into a normalized (1, D) float32 array."""
+        q = np.array(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(q)
+        return q
+
+    def get(self, vector, scope: str = ""):
+        """
+        Look up a cached value for a query embedding.
+
+        Args:
+            vector: Query embedding
+            scope: Extra key that must match exactly (e.g. conversation history)
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        if self._index is None or self._index.ntotal == 0:
+            return None
+
+        q = self._as_query(vector)
+        scores, ids = self._index.search(q, min(SEARCH_K, self._index.ntotal))
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id < 0 or score < self.threshold:
+                break
+            entry_scope, value = self._entries[int(entry_id)]
+            if entry_scope == scope:
+                self._entries.move_to_end(int(entry_id))
+                return value
+
+        return None
+
+    def put(self, vector, value, scope: str = "") -> None:
+        """Store a value for a query embedding, evicting the oldest entry if full."""
+        q = self._as_query(vector)
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(q.shape[1]))
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._index.add_with_ids(q, np.array([entry_id], dtype=np.int64))
+        self._entries[entry_id] = (scope, value)
+
+        if len(self._entries) > self.max_entries:
+            oldest_id, _ = self._entries.popitem(last=False)
+            self._index.remove_ids(np.array([oldest_id], dtype=np.int64))
+
+
+class TTLCache:
+    """Thread-safe exact-match cache whose entries expire after a fixed time-to-live."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class LRUCache:
+    """Thread-safe exact-match cache that evicts the least recently used entry when full."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """Return the cached value for key, or default if missing."""
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
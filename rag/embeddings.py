@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Embedding model shared by the indexer and retriever.
+Runs FastEmbed's int8-quantized ONNX export of the model on ONNX Runtime.
+"""
+
+import os
+
+import numpy as np
+from fastembed import TextEmbedding
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer
+
+# Embedding model (fastembed - lightweight, no PyTorch)
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+
+# Texts embedded per ONNX Runtime forward pass
+EMBEDDING_BATCH_SIZE = 64
+
+
+class OnnxBGEEmbeddings(Embeddings):
+    """
+    LangChain-compatible embeddings on an int8 ONNX Runtime BGE model.
+    embed_array returns float32 numpy directly for the FAISS search path.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = TextEmbedding(
+            model_name=model_name,
+            threads=os.cpu_count(),
+            providers=["CPUExecutionProvider"],
+        )
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts into an (N, D) float32 array of L2-normalized vectors.
+        The retriever's inner-product search relies on this normalization.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        vectors = np.vstack(list(self._model.embed(texts, batch_size=self.batch_size))).astype(np.float32, copy=False)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def get_embeddings() -> OnnxBGEEmbeddings:
+    """Create the embedding model with one ONNX Runtime thread per CPU core."""
+    return OnnxBGEEmbeddings()
+
+
+def get_tokenizer() -> Tokenizer:
+    """Load the embedding model's tokenizer (for sizing chunks in tokens)."""
+    return Tokenizer.from_pretrained(EMBEDDING_MODEL)
@@ -2,56 +2,70 @@
 """
 Indexer for macOS Tahoe RAG chatbot.
 Loads documents, chunks them, creates embeddings, and stores in ChromaDB.
+Only documents whose content changed since the last run are re-embedded.
 """
 
+import hashlib
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import chromadb
+from chromadb.utils.batch_utils import create_batches
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_community.embeddings import FastEmbedEmbeddings
-from langchain_chroma import Chroma
+
+from rag.embeddings import EMBEDDING_MODEL, get_embeddings, get_tokenizer
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
 DOCS_DIR = BASE_DIR / "docs"
 CHROMA_DIR = BASE_DIR / "rag" / "chroma_db"
+MANIFEST_PATH = CHROMA_DIR / "manifest.json"  # settings + source -> {sha256, chunk_ids}
+COLLECTION_NAME = "langchain"  # Name used by earlier LangChain-built indexes
+
+# Below this many files a process pool costs more than it saves
+PARALLEL_LOAD_MIN_FILES = 64
+
+# Chunking parameters (in embedding-model tokens)
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 50
 
-# Embedding model (fastembed - lightweight, no PyTorch)
-EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
 
-# Chunking parameters
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+def _read_utf8(path: Path) -> str:
+    return path.read_text(encoding="utf-8")
 
 
 def load_documents():
     """Load all text documents from the docs folder."""
     print(f"Loading documents from {DOCS_DIR}...")
 
-    loader = DirectoryLoader(
-        str(DOCS_DIR),
-        glob="**/*.txt",
-        loader_cls=TextLoader,
-        loader_kwargs={"encoding": "utf-8"}
-    )
-
-    docs = loader.load()
+    paths = sorted(DOCS_DIR.rglob("*.txt"))
+    if len(paths) >= PARALLEL_LOAD_MIN_FILES:
+        with ProcessPoolExecutor() as executor:
+            texts = list(executor.map(_read_utf8, paths, chunksize=16))
+    else:
+        texts = [_read_utf8(path) for path in paths]
+
+    # Source filename is used as the document's metadata
+    docs = [
+        Document(page_content=text, metadata={"source": path.name})
+        for path, text in zip(paths, texts)
+    ]
     print(f"Loaded {len(docs)} documents")
 
-    for doc in docs:
-        # Add source filename to metadata
-        doc.metadata["source"] = Path(doc.metadata["source"]).name
-
     return docs
 
 
 def chunk_documents(docs):
-    """Split documents into smaller chunks."""
-    print(f"Chunking documents (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP})...")
+    """Split documents into chunks of at most CHUNK_SIZE tokens."""
+    print(f"Chunking documents (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP} tokens)...")
 
+    tokenizer = get_tokenizer()
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
+        length_function=lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids),
     )
 
     splits = text_splitter.split_documents(docs)
@@ -60,32 +74,134 @@ def chunk_documents(docs):
     return splits
 
 
-def create_vectorstore(chunks):
-    """Create ChromaDB vectorstore with embeddings."""
-    print(f"Creating embeddings with {EMBEDDING_MODEL}...")
+def content_hash(text: str) -> str:
+    """Hash document content to detect changes between runs."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
 
-    # Remove old database if exists
-    if CHROMA_DIR.exists():
-        import shutil
-        shutil.rmtree(CHROMA_DIR)
-        print("Removed old vector database")
+def index_settings() -> dict:
+    """Settings that produced the indexed chunks; changing any invalidates all of them."""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
 
-    print("Creating vector store...")
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DIR)
-    )
 
-    print(f"Vector store created with {vectorstore._collection.count()} vectors")
+def load_manifest() -> dict:
+    """
+    Load the indexed sources from the manifest, or {} if there is none or
+    it was built with different settings.
+    """
+    if not MANIFEST_PATH.exists():
+        return {}
+
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    if manifest.get("settings") != index_settings():
+        print("Index settings changed, rebuilding")
+        return {}
+    return manifest["sources"]
+
+
+def save_manifest(sources: dict):
+    manifest = {"settings": index_settings(), "sources": sources}
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def add_chunks(client, collection, chunks) -> dict[str, list[str]]:
+    """Embed chunks in one batched call and upsert them into the collection.
+
+    Returns the new chunk ids grouped by source.
+    """
+    if not chunks:
+        return {}
+
+    print(f"Creating embeddings with {EMBEDDING_MODEL}...")
+    embeddings = get_embeddings()
+
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    ids = []
+    ids_by_source: dict[str, list[str]] = {}
+    for chunk in chunks:
+        source = chunk.metadata["source"]
+        source_ids = ids_by_source.setdefault(source, [])
+        chunk_id = f"{source}:{len(source_ids)}"
+        source_ids.append(chunk_id)
+        ids.append(chunk_id)
+
+    # Embed every chunk before touching the vector store
+    vectors = embeddings.embed_documents(texts)
+
+    for batch_ids, batch_vectors, batch_metadatas, batch_texts in create_batches(
+        api=client,
+        ids=ids,
+        embeddings=vectors,
+        metadatas=metadatas,
+        documents=texts,
+    ):
+        # Upsert: ids are fixed per source, and a run that crashed before
+        # saving the manifest may have left these ids with old content
+        collection.upsert(
+            ids=batch_ids,
+            embeddings=batch_vectors,
+            metadatas=batch_metadatas,
+            documents=batch_texts,
+        )
+
+    return ids_by_source
+
+
+def update_vectorstore(docs, rebuild: bool = False):
+    """
+    Bring the ChromaDB collection in line with docs.
+
+    Unchanged documents (same sha256 as in the manifest) are skipped; chunks
+    of changed or deleted documents are removed and changed or new documents
+    are re-chunked and embedded. Without a manifest, when the embedding
+    model or chunking settings changed, or with rebuild=True the collection
+    is recreated from scratch.
+    """
+    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+    manifest = {} if rebuild else load_manifest()
+
+    if not manifest:
+        # No record of what is indexed, so start from an empty collection
+        try:
+            client.delete_collection(COLLECTION_NAME)
+            print("Removed old vector collection")
+        except Exception:
+            pass  # Nothing indexed yet
+    collection = client.get_or_create_collection(COLLECTION_NAME)
+
+    hashes = {doc.metadata["source"]: content_hash(doc.page_content) for doc in docs}
+    changed = [
+        doc for doc in docs
+        if manifest.get(doc.metadata["source"], {}).get("sha256") != hashes[doc.metadata["source"]]
+    ]
+    removed = [source for source in manifest if source not in hashes]
+    print(f"{len(docs) - len(changed)} unchanged, {len(changed)} new/changed, {len(removed)} removed")
+
+    # Drop stale chunks of changed and removed documents
+    stale_ids = []
+    for source in removed + [doc.metadata["source"] for doc in changed]:
+        stale_ids.extend(manifest.pop(source, {}).get("chunk_ids", []))
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+
+    ids_by_source = add_chunks(client, collection, chunk_documents(changed) if changed else [])
+    for doc in changed:
+        source = doc.metadata["source"]
+        manifest[source] = {"sha256": hashes[source], "chunk_ids": ids_by_source.get(source, [])}
+    save_manifest(manifest)
+
+    print(f"Vector store has {collection.count()} vectors")
     print(f"Saved to {CHROMA_DIR}")
 
-    return vectorstore
+    return collection
 
 
-def index_documents():
+def index_documents(rebuild: bool = False):
     """Main indexing pipeline."""
     print("=" * 50)
     print("macOS Tahoe RAG - Document Indexer")
@@ -94,18 +210,15 @@ def index_documents():
     # Load
     docs = load_documents()
 
-    # Chunk
-    chunks = chunk_documents(docs)
-
-    # Create vectorstore
-    vectorstore = create_vectorstore(chunks)
+    # Chunk, embed and store whatever changed
+    collection = update_vectorstore(docs, rebuild=rebuild)
 
     print("=" * 50)
     print("Indexing complete!")
     print("=" * 50)
 
-    return vectorstore
+    return collection
 
 
 if __name__ == "__main__":
-    index_documents()
+    index_documents(rebuild="--rebuild" in sys.argv[1:])
@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
 """
 Retriever for macOS Tahoe RAG chatbot.
-Searches ChromaDB for relevant document chunks.
+Loads the ChromaDB collection into an in-process FAISS HNSW index
+(float16 vectors) and searches it for relevant document chunks.
 Uses hybrid search: semantic similarity + keyword boosting.
 """
 
+import hashlib
+import heapq
+import os
 import re
+import tempfile
+from itertools import chain
 from pathlib import Path
-from langchain_community.embeddings import FastEmbedEmbeddings
-from langchain_chroma import Chroma
+
+import ahocorasick
+import chromadb
+import faiss
+import numpy as np
+
+from rag.cache import LRUCache, TTLCache
+from rag.embeddings import EMBEDDING_MODEL, get_embeddings
+
+# Optional: compiled rerank kernel (falls back to NumPy without numba)
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
 CHROMA_DIR = BASE_DIR / "rag" / "chroma_db"
+COLLECTION_NAME = "langchain"  # Must match indexer
 
-# Embedding model (must match indexer)
-EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+# FAISS HNSW parameters
+HNSW_M = 32  # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Query caches (keyed by a hash of embedding model + query text)
+QUERY_CACHE_SIZE = 2048
+QUERY_CACHE_TTL = 3600  # Seconds; results only change on re-index
+EMBED_CACHE_SIZE = 4096
 
 # Retrieval parameters
 TOP_K = 5  # Number of chunks to retrieve
@@ -28,6 +55,132 @@ KEY_TERMS = {
     "siri", "safari", "finder", "system settings", "battery", "wifi",
     "compatible", "upgrade", "features", "new", "release"
 }
+_KEY_TERM_IDS = {term: i for i, term in enumerate(sorted(KEY_TERMS))}
+
+# Keyword boost weights (subtracted from the semantic score)
+WORD_BOOST = 0.05  # Per query word found in the chunk
+TERM_BOOST = 0.1  # Per key term in both query and chunk
+MAX_BOOST = 0.3
+
+# Query words (4+ chars) that count toward the keyword boost
+_WORD_RE = re.compile(r'\b\w{4,}\b')
+
+# One automaton finds every key term in a chunk in a single pass
+_KEY_TERMS_AC = ahocorasick.Automaton()
+for _term in KEY_TERMS:
+    _KEY_TERMS_AC.add_word(_term, _term)
+_KEY_TERMS_AC.make_automaton()
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _rerank_kernel(semantic, word_hits, candidates, term_ids, term_offsets, query_term_mask, k):
+        """
+        Boost and score ANN candidates, returning (top, final, boosts) where
+        top indexes the k lowest final scores in ascending order.
+        """
+        n = semantic.shape[0]
+        boosts = np.empty(n, dtype=np.float32)
+        final = np.empty(n, dtype=np.float32)
+        top = np.empty(min(k, n), dtype=np.int64)
+        count = 0
+
+        for j in range(n):
+            # Key terms in the chunk (precomputed) that are also in the query
+            c = candidates[j]
+            term_hits = 0
+            for t in range(term_offsets[c], term_offsets[c + 1]):
+                if query_term_mask[term_ids[t]]:
+                    term_hits += 1
+
+            boosts[j] = min(WORD_BOOST * word_hits[j] + TERM_BOOST * term_hits, MAX_BOOST)
+            final[j] = semantic[j] - boosts[j]
+
+            # Insert into the bounded, sorted top-k
+            if count < top.shape[0]:
+                pos = count
+                count += 1
+            elif final[j] < final[top[count - 1]]:
+                pos = count - 1
+            else:
+                continue
+            while pos > 0 and final[top[pos - 1]] > final[j]:
+                top[pos] = top[pos - 1]
+                pos -= 1
+            top[pos] = j
+
+        return top, final, boosts
+
+
+def _index_path(ids: list[str], docs: list[str], dim: int) -> Path:
+    """
+    Path of the saved HNSW index for this corpus (ids, text and order),
+    embedding model and dimension, and index settings.
+    """
+    settings = f"{EMBEDDING_MODEL}|{dim}|{HNSW_M}|{HNSW_EF_CONSTRUCTION}|fp16|ip"
+    digest = hashlib.blake2b(settings.encode("utf-8"), digest_size=16)
+    for chunk_id, doc in zip(ids, docs):
+        digest.update(f"\0{chunk_id}\0{doc}".encode("utf-8"))
+    return CHROMA_DIR / f"hnsw-{digest.hexdigest()}.index"
+
+
+def _build_index(vectors: np.ndarray):
+    """Build the in-process ANN index; queries never touch Chroma."""
+    # Vectors are normalized here and queries by embed_array, so inner
+    # product is cosine similarity and search needs no distance math
+    faiss.normalize_L2(vectors)
+    # Stored as float16, halving resident vector bytes; queries stay float32
+    index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.train(vectors)  # No-op statistics for fp16, but required before add
+    index.add(vectors)
+    return index
+
+
+def _read_index(path: Path):
+    """
+    Load a saved index, memory-mapped where FAISS supports it. Returns None
+    if the file is missing or unreadable (e.g. truncated), so the caller
+    rebuilds it.
+    """
+    if not path.exists():
+        return None
+    # IO_FLAG_MMAP only applies to IVF inverted lists; MMAP_IFC maps this
+    # file but is missing from older faiss releases
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap_flag is not None:
+        try:
+            return faiss.read_index(str(path), mmap_flag)
+        except RuntimeError:
+            pass
+    try:
+        return faiss.read_index(str(path))
+    except RuntimeError as e:
+        print(f"Warning: Discarding unreadable ANN index {path.name}: {e}")
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        return None
+
+
+def _write_index(index, path: Path):
+    """Save the index for the next start, replacing indexes of older corpora."""
+    try:
+        # Write to a temp file and rename, so readers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=CHROMA_DIR, prefix="hnsw-", suffix=".tmp")
+        os.close(fd)
+        try:
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        for old_path in CHROMA_DIR.glob("hnsw-*.index"):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: Could not save ANN index: {e}")  # e.g. read-only deploys
 
 
 class MacOSTahoeRetriever:
@@ -35,8 +188,17 @@ class MacOSTahoeRetriever:
 
     def __init__(self):
         self.embeddings = None
-        self.vectorstore = None
+        self._index = None
+        self._docs: list[str] = []
+        self._docs_lower: list[str] = []  # For keyword matching
+        self._term_ids = None  # Key-term ids per chunk (flat), for the numba kernel
+        self._term_offsets = None
+        self._metadatas: list[dict] = []
         self._initialized = False
+        self._query_cache = TTLCache(ttl=QUERY_CACHE_TTL, maxsize=QUERY_CACHE_SIZE)
+        self._embed_cache = LRUCache(maxsize=EMBED_CACHE_SIZE)
+        self._hits = 0
+        self._misses = 0
 
     def initialize(self):
         """Initialize the retriever (lazy loading)."""
@@ -49,35 +211,172 @@ class MacOSTahoeRetriever:
             )
 
         print("Loading embedding model...")
-        self.embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
+        self.embeddings = get_embeddings()
 
         print("Loading vector store...")
-        self.vectorstore = Chroma(
-            persist_directory=str(CHROMA_DIR),
-            embedding_function=self.embeddings
-        )
+        collection = chromadb.PersistentClient(path=str(CHROMA_DIR)).get_collection(COLLECTION_NAME)
+        data = collection.get(include=["documents", "metadatas"])
+
+        # Reuse the HNSW graph saved for this exact corpus if there is one
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        dim = len(sample[0]) if len(sample) else 0
+        index_path = _index_path(data["ids"], data["documents"], dim)
+        self._index = _read_index(index_path)
+        if self._index is None:
+            print("Building ANN index...")
+            data = collection.get(include=["embeddings", "documents", "metadatas"])
+            vectors = np.asarray(data["embeddings"], dtype=np.float32)
+            index_path = _index_path(data["ids"], data["documents"], vectors.shape[1])
+            self._index = _build_index(vectors)
+            _write_index(self._index, index_path)
+        self._index.hnsw.efSearch = HNSW_EF_SEARCH
+
+        self._docs = data["documents"]
+        self._docs_lower = [doc.lower() for doc in self._docs]
+        if _NUMBA_AVAILABLE:
+            term_lists = [
+                sorted({_KEY_TERM_IDS[term] for _, term in _KEY_TERMS_AC.iter(doc)})
+                for doc in self._docs_lower
+            ]
+            self._term_offsets = np.zeros(len(term_lists) + 1, dtype=np.int64)
+            np.cumsum([len(terms) for terms in term_lists], out=self._term_offsets[1:])
+            self._term_ids = np.fromiter(chain.from_iterable(term_lists), dtype=np.int32)
+        self._metadatas = data["metadatas"]
 
         self._initialized = True
-        print(f"Retriever initialized with {self.vectorstore._collection.count()} vectors")
+        print(f"Retriever initialized with {self._index.ntotal} vectors")
 
-    def _keyword_boost(self, query: str, content: str) -> float:
-        """Calculate keyword match boost score."""
+    def warmup(self):
+        """
+        Initialize and run one query end to end, so the first user doesn't
+        pay for ONNX session warm-up, kernel compilation and paging in the
+        model and index.
+        """
+        self.initialize()
+        self.retrieve("warmup", k=1)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query with the retriever's embedding model."""
+        if not self._initialized:
+            self.initialize()
+
+        return self._embed_queries([query])[0]
+
+    @staticmethod
+    def _cache_key(query: str) -> str:
+        return hashlib.blake2b(f"{EMBEDDING_MODEL}|{query}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def _embed_queries(self, queries: list[str]) -> np.ndarray:
+        """Embed queries, reusing cached vectors and embedding the misses in one batch."""
+        keys = [self._cache_key(query) for query in queries]
+        vectors = [self._embed_cache.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embeddings.embed_array([queries[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                self._embed_cache.set(keys[i], vector)
+                vectors[i] = vector
+
+        return np.vstack(vectors)
+
+    def clear_cache(self):
+        """Drop cached query results and embeddings (e.g. after re-indexing)."""
+        self._query_cache.clear()
+        self._embed_cache.clear()
+
+    def cache_info(self) -> dict:
+        """Query result cache statistics."""
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "results": len(self._query_cache),
+            "embeddings": len(self._embed_cache),
+        }
+
+    @staticmethod
+    def _query_features(query: str) -> tuple[set[str], set[str]]:
+        """Precompute a query's boost words and key terms once per query."""
         query_lower = query.lower()
-        content_lower = content.lower()
+        query_words = set(_WORD_RE.findall(query_lower))
+        query_terms = {term for term in KEY_TERMS if term in query_lower}
+        return query_words, query_terms
+
+    def _keyword_boost(self, query_words: set[str], query_terms: set[str], content_lower: str) -> float:
+        """Calculate keyword match boost score."""
+        # Check for words from query in content
+        boost = WORD_BOOST * sum(1 for word in query_words if word in content_lower)
+
+        # Extra boost for important macOS terms present in both query and content
+        if query_terms:
+            content_terms = {term for _, term in _KEY_TERMS_AC.iter(content_lower)}
+            boost += TERM_BOOST * len(query_terms & content_terms)
+
+        return min(boost, MAX_BOOST)
+
+    def _score_and_rerank(
+        self, query_words: set[str], query_terms: set[str], semantic: np.ndarray, ids: np.ndarray, k: int
+    ) -> list[tuple]:
+        """
+        Boost and score candidates in a single pass, keeping only the k best
+        in a bounded heap. Returns (final, semantic, boost, doc id) tuples,
+        best first.
+        """
+        def scored():
+            for semantic_score, i in zip(semantic.tolist(), ids.tolist()):
+                keyword_boost = self._keyword_boost(query_words, query_terms, self._docs_lower[i])
+                # Lower score = better
+                # Subtract boost to improve ranking
+                yield semantic_score - keyword_boost, semantic_score, keyword_boost, i
+
+        return heapq.nsmallest(k, scored())
+
+    def _rerank(self, query: str, similarities: np.ndarray, ids: np.ndarray, k: int) -> tuple[list[dict], bool]:
+        """Apply keyword boosting to one query's ANN candidates and keep the top k."""
+        if k <= 0:  # The numba kernel assumes room for at least one result
+            return [], False
+
+        query_words, query_terms = self._query_features(query)
+
+        found = ids >= 0  # Fewer vectors than INITIAL_K
+        ids = ids[found]
+        # Squared L2 distance between unit vectors (same scale as ChromaDB,
+        # so RELEVANCE_THRESHOLD keeps its meaning)
+        semantic = 2.0 - 2.0 * similarities[found].astype(np.float32, copy=False)
+
+        if _NUMBA_AVAILABLE:
+            word_hits = np.fromiter(
+                (sum(1 for word in query_words if word in self._docs_lower[i]) for i in ids),
+                dtype=np.int32,
+                count=len(ids),
+            )
+            query_term_mask = np.zeros(len(_KEY_TERM_IDS), dtype=np.bool_)
+            query_term_mask[[_KEY_TERM_IDS[term] for term in query_terms]] = True
+            top, final, boosts = _rerank_kernel(
+                semantic, word_hits, ids, self._term_ids, self._term_offsets, query_term_mask, k
+            )
+            ranked = [(float(final[j]), float(semantic[j]), float(boosts[j]), int(ids[j])) for j in top]
+        else:
+            ranked = self._score_and_rerank(query_words, query_terms, semantic, ids, k)
 
-        boost = 0.0
-        # Check for key terms from query in content
-        query_words = set(re.findall(r'\b\w+\b', query_lower))
-        for word in query_words:
-            if len(word) > 3 and word in content_lower:
-                boost += 0.05
+        if not ranked:  # No ANN candidates
+            return [], False
+
+        top_chunks = [
+            {
+                "content": self._docs[i],
+                "source": (self._metadatas[i] or {}).get("source", "unknown"),
+                "score": final_score,
+                "semantic_score": semantic_score,
+                "keyword_boost": keyword_boost,
+            }
+            for final_score, semantic_score, keyword_boost, i in ranked
+        ]
 
-        # Extra boost for important macOS terms
-        for term in KEY_TERMS:
-            if term in query_lower and term in content_lower:
-                boost += 0.1
+        # Check if best result is relevant enough
+        is_relevant = top_chunks[0]["score"] < RELEVANCE_THRESHOLD
 
-        return min(boost, 0.3)  # Cap boost at 0.3
+        return top_chunks, is_relevant
 
     def retrieve(self, query: str, k: int = TOP_K) -> tuple[list[dict], bool]:
         """
@@ -95,35 +394,53 @@ class MacOSTahoeRetriever:
         if not self._initialized:
             self.initialize()
 
+        key = (self._cache_key(query), k)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._hits += 1
+            return cached
+        self._misses += 1
+
         # Retrieve more candidates initially
-        results = self.vectorstore.similarity_search_with_score(query, k=INITIAL_K)
+        query_vector = self._embed_queries([query])
+        similarities, ids = self._index.search(query_vector, INITIAL_K)
 
         # Score and rerank with keyword boosting
-        chunks = []
-        for doc, semantic_score in results:
-            content = doc.page_content
-            keyword_boost = self._keyword_boost(query, content)
-
-            # Lower score = better in ChromaDB (distance metric)
-            # Subtract boost to improve ranking
-            final_score = semantic_score - keyword_boost
-
-            chunks.append({
-                "content": content,
-                "source": doc.metadata.get("source", "unknown"),
-                "score": final_score,
-                "semantic_score": semantic_score,
-                "keyword_boost": keyword_boost
-            })
+        result = self._rerank(query, similarities[0], ids[0], k)
+        self._query_cache.set(key, result)
+        return result
 
-        # Sort by final score (lower is better) and return top k
-        chunks.sort(key=lambda x: x["score"])
-        top_chunks = chunks[:k]
+    def retrieve_many(self, queries: list[str], k: int = TOP_K) -> list[tuple[list[dict], bool]]:
+        """
+        Retrieve chunks for many queries at once (evaluation, benchmarks).
+        Cached queries are served from the result cache; the rest are
+        embedded in one batched call and searched with a single ANN search.
 
-        # Check if best result is relevant enough
-        is_relevant = bool(top_chunks and top_chunks[0]["score"] < RELEVANCE_THRESHOLD)
+        Returns:
+            One (chunks, is_relevant) tuple per query, as from retrieve().
+        """
+        if not self._initialized:
+            self.initialize()
 
-        return top_chunks, is_relevant
+        if not queries:
+            return []
+
+        keys = [(self._cache_key(query), k) for query in queries]
+        results = [self._query_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        self._hits += len(queries) - len(missing)
+        self._misses += len(missing)
+
+        if missing:
+            # One batched forward pass and ANN search for every uncached query
+            query_vectors = self._embed_queries([queries[i] for i in missing])
+            similarities, ids = self._index.search(query_vectors, INITIAL_K)
+
+            for row, i in enumerate(missing):
+                results[i] = self._rerank(queries[i], similarities[row], ids[row], k)
+                self._query_cache.set(keys[i], results[i])
+
+        return results
 
     def format_context(self, chunks: list[dict]) -> str:
         """Format retrieved chunks as context for the LLM."""
@@ -162,12 +479,14 @@ if __name__ == "__main__":
         "What is Liquid Glass?",
     ]
 
-    for query in test_queries:
+    # One batched embedding pass and ANN search for every test query
+    results = retriever.retrieve_many(test_queries, k=3)
+
+    for query, (chunks, is_relevant) in zip(test_queries, results):
         print(f"\n{'='*50}")
         print(f"Query: {query}")
         print("=" * 50)
 
-        chunks, is_relevant = retriever.retrieve(query, k=3)
         print(f"Relevant: {is_relevant}")
         for i, chunk in enumerate(chunks, 1):
             print(f"\n[{i}] Source: {chunk['source']} (score: {chunk['score']:.4f})")
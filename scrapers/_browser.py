@@ -0,0 +1,76 @@
+"""Playwright helpers shared by the browser-based scrapers."""
+
+import asyncio
+from typing import Awaitable, Callable
+
+from playwright.async_api import Browser, Route, TimeoutError as PlaywrightTimeoutError, async_playwright
+
+# Pages loaded at once (each in its own browser context)
+MAX_CONCURRENT_PAGES = 4
+
+# Requests not needed to extract page text
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+
+# Text of the first selector with meaningful content, else the whole body
+EXTRACT_TEXT_JS = """
+selectors => {
+    for (const selector of selectors) {
+        const element = document.querySelector(selector);
+        if (element && element.innerText.length > 200) return element.innerText;
+    }
+    return document.body ? document.body.innerText : "";
+}
+"""
+
+
+async def block_resources(route: Route):
+    """Abort requests for resources that don't affect the page's text."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def extract_page_text(
+    browser: Browser, url: str, selectors: list[str], java_script_enabled: bool = True
+) -> tuple[str, str]:
+    """Load a page in its own context and return (title, raw text)."""
+    context = await browser.new_context(java_script_enabled=java_script_enabled)
+    await context.route("**/*", block_resources)
+    page = await context.new_page()
+
+    try:
+        print(f"  Loading: {url}")
+        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+
+        # Wait for a content container to render instead of for network idle
+        try:
+            await page.wait_for_selector(", ".join(selectors), timeout=8000)
+        except PlaywrightTimeoutError:
+            pass  # Fall back to the body
+
+        title = await page.title()
+        content = await page.evaluate(EXTRACT_TEXT_JS, selectors)
+        return title, content
+
+    finally:
+        await context.close()
+
+
+async def scrape_all(
+    urls: list[tuple[str, str]],
+    scrape: Callable[[Browser, str, str], Awaitable[tuple[bool, str]]],
+) -> list[tuple[bool, str]]:
+    """Run scrape(browser, name, url) for every URL on one shared browser, in URL order."""
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+        async def scrape_one(name: str, url: str) -> tuple[bool, str]:
+            async with semaphore:
+                return await scrape(browser, name, url)
+
+        try:
+            return await asyncio.gather(*(scrape_one(name, url) for name, url in urls))
+        finally:
+            await browser.close()
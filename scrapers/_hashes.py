@@ -0,0 +1,38 @@
+"""Content hashes of saved docs, so unchanged pages aren't rewritten."""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+
+HASHES_FILE = ".hashes.json"  # Filename -> content hash, kept in the docs folder
+
+# The scrape timestamp changes every run, so it is left out of the hash
+_RE_SCRAPED_LINE = re.compile(r'^Scraped: .*$', re.MULTILINE)
+
+
+def content_hash(doc: str) -> str:
+    """Hash a scraped document, ignoring its timestamp."""
+    return hashlib.blake2b(_RE_SCRAPED_LINE.sub('', doc).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_hashes(docs_dir: Path) -> dict[str, str]:
+    path = docs_dir / HASHES_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def save_hashes(docs_dir: Path, hashes: dict[str, str]):
+    (docs_dir / HASHES_FILE).write_text(json.dumps(hashes, indent=2, sort_keys=True), encoding='utf-8')
+
+
+def write_if_changed(file_path: Path, doc: str, hashes: dict[str, str]) -> bool:
+    """Write doc unless it matches the last saved version. Returns True if written."""
+    digest = content_hash(doc)
+    if hashes.get(file_path.name) == digest and file_path.exists():
+        return False
+
+    file_path.write_text(doc, encoding='utf-8')
+    hashes[file_path.name] = digest
+    return True
@@ -0,0 +1,16 @@
+"""Text cleanup shared by the scrapers."""
+
+import re
+
+_RE_BLANKLINES = re.compile(r'\n\s*\n')
+_RE_SPACES = re.compile(r' +')
+
+
+def clean_text(text: str) -> str:
+    """Clean extracted text by removing extra whitespace."""
+    # Replace multiple newlines with double newline
+    text = _RE_BLANKLINES.sub('\n\n', text)
+    # Replace multiple spaces with single space
+    text = _RE_SPACES.sub(' ', text)
+    # Strip lines
+    return '\n'.join(line.strip() for line in text.splitlines()).strip()
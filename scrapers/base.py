@@ -6,14 +6,24 @@ Targets specific Apple pages about macOS Tahoe and saves content as text files
 for use in RAG (Retrieval Augmented Generation).
 """
 
+import asyncio
 import os
-import re
 import time
 from pathlib import Path
 from urllib.parse import urlparse
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+
+# selectolax (Lexbor C parser) is much faster; BeautifulSoup is the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    _SELECTOLAX_AVAILABLE = True
+except ImportError:
+    from bs4 import BeautifulSoup
+    _SELECTOLAX_AVAILABLE = False
+
+from scrapers._hashes import load_hashes, save_hashes, write_if_changed
+from scrapers._text import clean_text
 
 # macOS Tahoe specific URLs to scrape
 URLS = [
@@ -43,46 +53,47 @@ HEADERS = {
 
 DOCS_DIR = Path(__file__).parent.parent / "docs"
 
-
-def clean_text(text: str) -> str:
-    """Clean extracted text by removing extra whitespace."""
-    # Replace multiple newlines with double newline
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    # Replace multiple spaces with single space
-    text = re.sub(r' +', ' ', text)
-    # Strip lines
-    lines = [line.strip() for line in text.split('\n')]
-    return '\n'.join(lines).strip()
+# Be polite - concurrent requests allowed to any one host
+MAX_REQUESTS_PER_HOST = 4
+
+# Elements removed before extracting text
+REMOVED_TAGS = ['script', 'style', 'nav', 'footer', 'header', 'aside']
+
+# Main content selectors for different Apple page types, in priority order
+CONTENT_SELECTORS = [
+    'main',
+    'article',
+    '.main-content',
+    '#main-content',
+    '.article-content',
+    '#content',
+    '.gb-localnav-content',
+    'div[role="main"]',
+]
 
 
-def extract_content(soup: BeautifulSoup, url: str) -> str:
+def extract_content(tree: "LexborHTMLParser", url: str) -> str:
     """Extract main content from the page."""
     # Remove script, style, nav, footer elements
-    for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-        element.decompose()
+    for node in tree.css(', '.join(REMOVED_TAGS)):
+        node.decompose()
 
     # Try to find main content area
-    main_content = None
-
-    # Different selectors for different Apple page types
-    selectors = [
-        'main',
-        'article',
-        '.main-content',
-        '#main-content',
-        '.article-content',
-        '#content',
-        '.gb-localnav-content',
-        'div[role="main"]',
-    ]
-
-    for selector in selectors:
-        main_content = soup.select_one(selector)
-        if main_content:
-            break
-
-    if not main_content:
-        main_content = soup.body
+    main_content = next(filter(None, map(tree.css_first, CONTENT_SELECTORS)), tree.body)
+
+    if main_content:
+        text = main_content.text(separator='\n', strip=True)
+        return clean_text(text)
+
+    return ""
+
+
+def extract_content_bs4(soup: "BeautifulSoup", url: str) -> str:
+    """Extract main content from the page (BeautifulSoup fallback)."""
+    for element in soup(REMOVED_TAGS):
+        element.decompose()
+
+    main_content = next(filter(None, map(soup.select_one, CONTENT_SELECTORS)), soup.body)
 
     if main_content:
         text = main_content.get_text(separator='\n')
@@ -91,20 +102,32 @@ def extract_content(soup: BeautifulSoup, url: str) -> str:
     return ""
 
 
-def scrape_url(name: str, url: str) -> tuple[bool, str]:
+def parse_page(html: str, name: str, url: str) -> tuple[str, str]:
+    """Parse a fetched page into (title, content)."""
+    if not _SELECTOLAX_AVAILABLE:
+        soup = BeautifulSoup(html, 'lxml')
+        title = soup.title.string if soup.title else name
+        return title, extract_content_bs4(soup, url)
+
+    tree = LexborHTMLParser(html)
+
+    # Extract title
+    title_node = tree.css_first('title')
+    title = title_node.text(strip=True) if title_node else name
+
+    # Extract content
+    return title, extract_content(tree, url)
+
+
+async def scrape_url(client: httpx.AsyncClient, name: str, url: str) -> tuple[bool, str]:
     """Scrape a single URL and return (success, content/error)."""
     try:
         print(f"  Fetching: {url}")
-        response = requests.get(url, headers=HEADERS, timeout=30)
+        response = await client.get(url)
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extract title
-        title = soup.title.string if soup.title else name
-
-        # Extract content
-        content = extract_content(soup, url)
+        # Parse off the event loop so other fetches keep going
+        title, content = await asyncio.to_thread(parse_page, response.text, name, url)
 
         if not content:
             return False, "No content extracted"
@@ -121,38 +144,50 @@ Scraped: {time.strftime('%Y-%m-%d %H:%M:%S')}
 """
         return True, doc
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         return False, f"Request error: {e}"
     except Exception as e:
         return False, f"Error: {e}"
 
 
-def main():
+async def main():
     """Main scraper function."""
     print("macOS Tahoe Documentation Scraper")
     print("=" * 50)
 
     DOCS_DIR.mkdir(exist_ok=True)
 
+    host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async with httpx.AsyncClient(http2=True, headers=HEADERS, timeout=30, follow_redirects=True) as client:
+        async def scrape(name: str, url: str) -> tuple[bool, str]:
+            host = urlparse(url).netloc
+            semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(MAX_REQUESTS_PER_HOST))
+            async with semaphore:
+                return await scrape_url(client, name, url)
+
+        results = await asyncio.gather(*(scrape(name, url) for name, url in URLS))
+
+    hashes = load_hashes(DOCS_DIR)
     success_count = 0
     fail_count = 0
 
-    for name, url in URLS:
+    for (name, _), (success, result) in zip(URLS, results):
         print(f"\n[{name}]")
-        success, result = scrape_url(name, url)
 
         if success:
             # Save to file
             file_path = DOCS_DIR / f"{name}.txt"
-            file_path.write_text(result, encoding='utf-8')
-            print(f"  ✓ Saved to {file_path.name}")
+            if write_if_changed(file_path, result, hashes):
+                print(f"  ✓ Saved to {file_path.name}")
+            else:
+                print(f"  = Unchanged: {file_path.name}")
             success_count += 1
         else:
             print(f"  ✗ Failed: {result}")
             fail_count += 1
 
-        # Be polite - wait between requests
-        time.sleep(1)
+    save_hashes(DOCS_DIR, hashes)
 
     print("\n" + "=" * 50)
     print(f"Done! Success: {success_count}, Failed: {fail_count}")
@@ -160,4 +195,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -4,10 +4,13 @@ Scraper for additional Apple Support articles using Playwright.
 """
 
 import asyncio
-import re
 import time
 from pathlib import Path
-from playwright.async_api import async_playwright
+from playwright.async_api import Browser
+
+from scrapers._browser import extract_page_text, scrape_all
+from scrapers._hashes import load_hashes, save_hashes, write_if_changed
+from scrapers._text import clean_text
 
 # Additional Apple Support URLs for troubleshooting and how-to content
 URLS = [
@@ -46,61 +49,30 @@ URLS = [
 
 DOCS_DIR = Path(__file__).parent.parent / "docs"
 
-
-def clean_text(text: str) -> str:
-    """Clean extracted text."""
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = re.sub(r' +', ' ', text)
-    lines = [line.strip() for line in text.split('\n')]
-    return '\n'.join(lines).strip()
+# Content selectors for Apple Support articles, in priority order
+CONTENT_SELECTORS = [
+    "main",
+    "article",
+    ".main-content",
+    "#main-content",
+    ".article-content",
+    "#content",
+    "[role='main']",
+]
 
 
-async def scrape_page(name: str, url: str) -> tuple[bool, str]:
+async def scrape_page(browser: Browser, name: str, url: str) -> tuple[bool, str]:
     """Scrape a page using Playwright."""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-
-        try:
-            print(f"  Loading: {url}")
-            await page.goto(url, wait_until="networkidle", timeout=30000)
-            await page.wait_for_timeout(2000)
-
-            title = await page.title()
-
-            # Try different selectors
-            content = ""
-            selectors = [
-                "main",
-                "article",
-                ".main-content",
-                "#main-content",
-                ".article-content",
-                "#content",
-                "[role='main']",
-            ]
-
-            for selector in selectors:
-                try:
-                    element = await page.query_selector(selector)
-                    if element:
-                        content = await element.inner_text()
-                        if len(content) > 200:
-                            break
-                except:
-                    continue
-
-            if not content or len(content) < 200:
-                content = await page.inner_text("body")
-
-            await browser.close()
-
-            if not content or len(content) < 100:
-                return False, "No meaningful content extracted"
-
-            content = clean_text(content)
-
-            doc = f"""# {title}
+    try:
+        # Support articles are server-rendered, so skip running their scripts
+        title, content = await extract_page_text(browser, url, CONTENT_SELECTORS, java_script_enabled=False)
+
+        if not content or len(content) < 100:
+            return False, "No meaningful content extracted"
+
+        content = clean_text(content)
+
+        doc = f"""# {title}
 
 Source: {url}
 Scraped: {time.strftime('%Y-%m-%d %H:%M:%S')}
@@ -110,11 +82,10 @@ Type: Apple Support Article
 
 {content}
 """
-            return True, doc
+        return True, doc
 
-        except Exception as e:
-            await browser.close()
-            return False, f"Error: {e}"
+    except Exception as e:
+        return False, f"Error: {e}"
 
 
 async def main():
@@ -124,23 +95,27 @@ async def main():
 
     DOCS_DIR.mkdir(exist_ok=True)
 
+    results = await scrape_all(URLS, scrape_page)
+
+    hashes = load_hashes(DOCS_DIR)
     success_count = 0
     fail_count = 0
 
-    for name, url in URLS:
+    for (name, _), (success, result) in zip(URLS, results):
         print(f"\n[{name}]")
-        success, result = await scrape_page(name, url)
 
         if success:
             file_path = DOCS_DIR / f"{name}.txt"
-            file_path.write_text(result, encoding='utf-8')
-            print(f"  ✓ Saved to {file_path.name} ({len(result)} chars)")
+            if write_if_changed(file_path, result, hashes):
+                print(f"  ✓ Saved to {file_path.name} ({len(result)} chars)")
+            else:
+                print(f"  = Unchanged: {file_path.name}")
             success_count += 1
         else:
             print(f"  ✗ Failed: {result}")
             fail_count += 1
 
-        await asyncio.sleep(1)
+    save_hashes(DOCS_DIR, hashes)
 
     print("\n" + "=" * 50)
     print(f"Done! Success: {success_count}, Failed: {fail_count}")
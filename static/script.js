@@ -73,6 +73,43 @@ function getSourceUrl(filename) {
     return sourceUrls[filename] || null;
 }
 
+function renderSources(sources = [], webSources = [], sourceType = 'rag') {
+    let html = '';
+
+    // RAG sources (show for "rag" or "both")
+    if ((sourceType === 'rag' || sourceType === 'both') && sources && sources.length > 0) {
+        const sourceItems = sources.map(s => {
+            const title = getSourceTitle(s);
+            const url = getSourceUrl(s);
+            if (url) {
+                return `<div class="source-item"><a href="${url}" target="_blank" rel="noopener noreferrer">▸ ${title}</a></div>`;
+            }
+            return `<div class="source-item">▸ ${title}</div>`;
+        }).join('');
+        html += `
+            <details class="sources-dropdown">
+                <summary>Doc Sources (${sources.length})</summary>
+                <div class="sources-list">${sourceItems}</div>
+            </details>
+        `;
+    }
+
+    // Web sources (show for "web" or "both")
+    if ((sourceType === 'web' || sourceType === 'both') && webSources && webSources.length > 0) {
+        const webItems = webSources.map(s =>
+            `<div class="source-item"><a href="${escapeHtml(s.url)}" target="_blank" rel="noopener noreferrer">▸ ${escapeHtml(s.title)}</a></div>`
+        ).join('');
+        html += `
+            <details class="sources-dropdown web-sources" open>
+                <summary>Web Sources (${webSources.length})</summary>
+                <div class="sources-list">${webItems}</div>
+            </details>
+        `;
+    }
+
+    return html;
+}
+
 function addMessage(content, role, sources = [], webSources = [], sourceType = 'rag') {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${role}`;
@@ -81,41 +118,23 @@ function addMessage(content, role, sources = [], webSources = [], sourceType = '
     let html = `<div class="message-content">${formattedContent}</div>`;
 
     if (role === 'assistant') {
-        // RAG sources (show for "rag" or "both")
-        if ((sourceType === 'rag' || sourceType === 'both') && sources && sources.length > 0) {
-            const sourceItems = sources.map(s => {
-                const title = getSourceTitle(s);
-                const url = getSourceUrl(s);
-                if (url) {
-                    return `<div class="source-item"><a href="${url}" target="_blank" rel="noopener noreferrer">▸ ${title}</a></div>`;
-                }
-                return `<div class="source-item">▸ ${title}</div>`;
-            }).join('');
-            html += `
-                <details class="sources-dropdown">
-                    <summary>Doc Sources (${sources.length})</summary>
-                    <div class="sources-list">${sourceItems}</div>
-                </details>
-            `;
-        }
-
-        // Web sources (show for "web" or "both")
-        if ((sourceType === 'web' || sourceType === 'both') && webSources && webSources.length > 0) {
-            const webItems = webSources.map(s =>
-                `<div class="source-item"><a href="${escapeHtml(s.url)}" target="_blank" rel="noopener noreferrer">▸ ${escapeHtml(s.title)}</a></div>`
-            ).join('');
-            html += `
-                <details class="sources-dropdown web-sources" open>
-                    <summary>Web Sources (${webSources.length})</summary>
-                    <div class="sources-list">${webItems}</div>
-                </details>
-            `;
-        }
+        html += renderSources(sources, webSources, sourceType);
     }
 
     messageDiv.innerHTML = html;
     chatContainer.appendChild(messageDiv);
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    return messageDiv;
+}
+
+function updateMessage(messageDiv, content) {
+    messageDiv.querySelector('.message-content').innerHTML = formatResponse(content);
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+function addMessageSources(messageDiv, sources = [], webSources = [], sourceType = 'rag') {
+    messageDiv.insertAdjacentHTML('beforeend', renderSources(sources, webSources, sourceType));
+    chatContainer.scrollTop = chatContainer.scrollHeight;
 }
 
 function addTypingIndicator() {
@@ -155,13 +174,40 @@ function formatResponse(text) {
     return formatted;
 }
 
+// Read a server-sent event stream, calling onEvent(event, data) for each event
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 async function sendMessage(message) {
     sendBtn.disabled = true;
     addMessage(message, 'user');
     addTypingIndicator();
 
     try {
-        const response = await fetch('/api/chat', {
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -170,18 +216,34 @@ async function sendMessage(message) {
             })
         });
 
-        removeTypingIndicator();
-
         if (!response.ok) {
             throw new Error('Failed to get response');
         }
 
-        const data = await response.json();
-        addMessage(data.response, 'assistant', data.sources || [], data.web_sources || [], data.source_type || 'rag');
+        // Render the answer as it streams in, then attach sources
+        let messageDiv = null;
+        let reply = '';
+        await readEvents(response, (event, data) => {
+            if (event === 'error') {
+                throw new Error(data.detail);
+            }
+            if (!messageDiv) {
+                removeTypingIndicator();
+                messageDiv = addMessage('', 'assistant');
+            }
+            if (event === 'sources') {
+                addMessageSources(messageDiv, data.sources || [], data.web_sources || [], data.source_type || 'rag');
+            } else {
+                reply += data.delta;
+                updateMessage(messageDiv, reply);
+            }
+        });
+
+        removeTypingIndicator();
 
         // Update history
         conversationHistory.push({ role: 'user', content: message });
-        conversationHistory.push({ role: 'assistant', content: data.response });
+        conversationHistory.push({ role: 'assistant', content: reply });
 
         // Keep history manageable (last 10 exchanges)
         if (conversationHistory.length > 20) {
@@ -1,4 +1,6 @@
 """Test WebBaseLoader on Apple release notes."""
+import asyncio
+
 from langchain_community.document_loaders import WebBaseLoader
 
 # Test with the release notes URL
@@ -7,17 +9,23 @@ urls = [
     "https://support.apple.com/en-us/122868",  # What's new (this worked before)
 ]
 
-for url in urls:
+
+async def load_all(loader: WebBaseLoader) -> list:
+    return [doc async for doc in loader.alazy_load()]
+
+
+# One loader fetches every URL concurrently (aiohttp) and parses with lxml
+loader = WebBaseLoader(web_paths=urls, requests_per_second=4, default_parser="lxml")
+docs = asyncio.run(load_all(loader))
+
+if not docs:
+    print("No documents loaded")
+
+for doc in docs:
     print(f"\n{'='*60}")
-    print(f"URL: {url}")
+    print(f"URL: {doc.metadata.get('source')}")
     print('='*60)
 
-    loader = WebBaseLoader(web_paths=[url])
-    docs = loader.load()
-
-    if docs:
-        content = docs[0].page_content[:1000]  # First 1000 chars
-        print(f"Content length: {len(docs[0].page_content)} chars")
-        print(f"Preview:\n{content}...")
-    else:
-        print("No documents loaded")
+    content = doc.page_content[:1000]  # First 1000 chars
+    print(f"Content length: {len(doc.page_content)} chars")
+    print(f"Preview:\n{content}...")